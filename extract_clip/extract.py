@@ -1,31 +1,33 @@
 # import clip.clip as clip
 import clip
 import torch
-from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
-model, _ = clip.load("ViT-B/16", device='cuda')
-new_state_dict = OrderedDict()
-for k, v in model.state_dict().items():
-    if 'visual.' in k:
-        if k[7:] not in ["proj", "ln_post.weight", "ln_post.bias"]:
-            new_state_dict[k[7:]] = v
+EXCLUDE_KEYS = frozenset(["proj", "ln_post.weight", "ln_post.bias"])
 
-torch.save(new_state_dict, 'vit_b16.pth')
 
-model, _ = clip.load("ViT-L/14", device='cuda')
-new_state_dict = OrderedDict()
-for k, v in model.state_dict().items():
-    if 'visual.' in k:
-        if k[7:] not in ["proj", "ln_post.weight", "ln_post.bias"]:
-            new_state_dict[k[7:]] = v
+def extract(name, out):
+    # only the visual weights are kept, so there is no need to move to GPU
+    model, _ = clip.load(name, device='cpu', jit=False)
+    # CLIP weights are released in fp16 and are cast when loaded into the
+    # model, saving them in fp16 halves the file size
+    new_state_dict = {
+        k[7:]: v.half().contiguous() for k, v in model.state_dict().items()
+        if k.startswith('visual.') and k[7:] not in EXCLUDE_KEYS
+    }
+    # the fp16 copies do not share storage with the model, free the fp32
+    # weights (including the text tower) before saving
+    del model
+    torch.save(new_state_dict, out, _use_new_zipfile_serialization=True)
 
-torch.save(new_state_dict, 'vit_l14.pth')
 
-model, _ = clip.load("ViT-L/14@336px", device='cuda')
-new_state_dict = OrderedDict()
-for k, v in model.state_dict().items():
-    if 'visual.' in k:
-        if k[7:] not in ["proj", "ln_post.weight", "ln_post.bias"]:
-            new_state_dict[k[7:]] = v
-
-torch.save(new_state_dict, 'vit_l14_336.pth')
\ No newline at end of file
+if __name__ == '__main__':
+    jobs = [
+        ("ViT-B/16", 'vit_b16.pth'),
+        ("ViT-L/14", 'vit_l14.pth'),
+        ("ViT-L/14@336px", 'vit_l14_336.pth'),
+    ]
+    with ThreadPoolExecutor(max_workers=len(jobs)) as executor:
+        futures = [executor.submit(extract, name, out) for name, out in jobs]
+        for future in futures:
+            future.result()
@@ -97,7 +97,9 @@ _C.AUG.COLOR_JITTER = 0.4
 # RandAug parameters.
 _C.AUG.AA_TYPE = "rand-m9-mstd0.5-inc1"
 
-# Interpolation method.
+# Interpolation method of the RandAugment geometric ops, options include
+# `bicubic`, `bilinear`, `nearest`, `lanczos`, `hamming` and `random`. `bilinear`
+# and `nearest` are much cheaper than `bicubic` on every frame.
 _C.AUG.INTERPOLATION = "bicubic"
 
 # Probability of random erasing.
@@ -856,9 +858,32 @@ _C.DATA_LOADER.NUM_WORKERS = 8
 # Load data to pinned host memory.
 _C.DATA_LOADER.PIN_MEMORY = True
 
+# Copy the next batch to the GPU on a side CUDA stream during training and
+# validation, overlapping the copy with compute. Works best with PIN_MEMORY.
+_C.DATA_LOADER.CUDA_PREFETCH = False
+
 # Enable multi thread decoding.
 _C.DATA_LOADER.ENABLE_MULTI_THREAD_DECODE = False
 
+# Number of batches kept ready by a background thread of the main process on
+# top of the worker queues, hiding slow-to-decode batches. 0 disables it.
+_C.DATA_LOADER.MAX_PREFETCH = 0
+
+# Balance the decoding cost (estimated by the video file size) across the
+# training batches handled concurrently by the workers, so that a batch of long
+# videos does not stall the loader. The file sizes are collected once when the
+# loader is constructed.
+_C.DATA_LOADER.BALANCE_DECODE_COST = False
+
+# Hint the kernel to read the video files of upcoming samples ahead of their
+# decoding (posix_fadvise). Helps when the videos are not in the page cache.
+_C.DATA_LOADER.READAHEAD = False
+
+# Number of decoded clips cached per data loader worker during testing, so that
+# the spatial crops of one temporal view decode, normalize and rescale the
+# video only once. Set to 0 to disable the cache.
+_C.DATA_LOADER.DECODE_CACHE_SIZE = 1
+
 
 # ---------------------------------------------------------------------------- #
 # Detection options.
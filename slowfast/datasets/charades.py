@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 # Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved.
 
+import numpy as np
 import os
 import random
 from itertools import chain as chain
@@ -88,19 +89,45 @@ class Charades(torch.utils.data.Dataset):
 
         if self.mode != "train":
             # Form video-level labels from frame level annotations.
-            self._labels = utils.convert_to_video_level_labels(self._labels)
+            video_labels = [
+                utils.aggregate_labels(labels) for labels in self._labels
+            ]
+            # Video-level labels do not depend on the sampled frames, so store
+            # them once in CSR form (few positives per video): the labels of
+            # row i are _label_indices[_label_indptr[i]:_label_indptr[i + 1]].
+            # Flat numpy arrays hold no per-object refcounts, so forked data
+            # loader workers keep sharing their pages.
+            self._label_indptr = np.cumsum(
+                [0] + [len(labels) for labels in video_labels]
+            )
+            self._label_indices = np.fromiter(
+                chain.from_iterable(video_labels), dtype=np.int64
+            )
+            # The frame-level labels are only read during training.
+            self._labels = None
 
+        # Map every clip to the row of its video, clips of the same video
+        # share one label row.
+        self._label_row = np.repeat(
+            np.arange(len(self._path_to_videos)), self._num_clips
+        )
         self._path_to_videos = list(
             chain.from_iterable(
                 [[x] * self._num_clips for x in self._path_to_videos]
             )
         )
-        self._labels = list(
-            chain.from_iterable([[x] * self._num_clips for x in self._labels])
-        )
+        if self._labels is not None:
+            self._labels = list(
+                chain.from_iterable(
+                    [[x] * self._num_clips for x in self._labels]
+                )
+            )
         self._spatial_temporal_idx = list(
             chain.from_iterable(
-                [range(self._num_clips) for _ in range(len(self._labels))]
+                [
+                    range(self._num_clips)
+                    for _ in range(len(self._path_to_videos))
+                ]
             )
         )
 
@@ -130,7 +157,8 @@ class Charades(torch.utils.data.Dataset):
             self.cfg.DATA.SAMPLING_RATE,
         )
         video_length = len(self._path_to_videos[index])
-        assert video_length == len(self._labels[index])
+        if self._labels is not None:
+            assert video_length == len(self._labels[index])
 
         clip_length = (num_frames - 1) * sampling_rate + 1
         if temporal_sample_index == -1:
@@ -216,19 +244,32 @@ class Charades(torch.utils.data.Dataset):
             )
         )
 
-        label = utils.aggregate_labels(
-            [self._labels[index][i] for i in range(seq[0], seq[-1] + 1)]
-        )
-        label = torch.as_tensor(
-            utils.as_binary_vector(label, self.cfg.MODEL.NUM_CLASSES)
-        )
+        if self.mode in ["train"]:
+            label = utils.aggregate_labels(
+                [self._labels[index][i] for i in range(seq[0], seq[-1] + 1)]
+            )
+            label = torch.as_tensor(
+                utils.as_binary_vector(label, self.cfg.MODEL.NUM_CLASSES)
+            )
+        else:
+            row = self._label_row[index]
+            # float64, like the as_binary_vector labels of training.
+            label = torch.zeros(
+                self.cfg.MODEL.NUM_CLASSES, dtype=torch.float64
+            )
+            label[
+                torch.from_numpy(
+                    self._label_indices[
+                        self._label_indptr[row] : self._label_indptr[row + 1]
+                    ]
+                )
+            ] = 1.0
 
         # Perform color normalization.
-        frames = utils.tensor_normalize(
+        # T H W C -> C T H W.
+        frames = utils.tensor_normalize_permute(
             frames, self.cfg.DATA.MEAN, self.cfg.DATA.STD
         )
-        # T H W C -> C T H W.
-        frames = frames.permute(3, 0, 1, 2)
         # Perform data augmentation.
         frames = utils.spatial_sampling(
             frames,
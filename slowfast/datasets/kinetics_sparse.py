@@ -1,16 +1,20 @@
 #!/usr/bin/env python3
 # Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved.
 
+import csv
+import numpy as np
 import os
 import random
+import pandas as pd
 import torch
 import torch.utils.data
 from iopath.common.file_io import g_pathmgr
-from torchvision import transforms
+from PIL import Image
 
 import slowfast.utils.logging as logging
 
 from . import decoder as decoder
+from . import transform as transform
 from . import utils as utils
 from . import video_container as container
 from .build import DATASET_REGISTRY
@@ -60,8 +64,11 @@ class Kinetics_sparse(torch.utils.data.Dataset):
         self.mode = mode
         self.cfg = cfg
 
+        # Per-clip meta data, created on first use and only filled by the
+        # torchvision decoder.
         self._video_meta = {}
         self._num_retries = num_retries
+        self._decode_threads = utils.get_num_decode_threads(cfg)
         # For training or validation mode, one single clip is sampled from every
         # video. For testing, NUM_ENSEMBLE_VIEWS clips are sampled from every
         # video. For every clip, NUM_SPATIAL_CROPS is cropped spatially from
@@ -77,6 +84,10 @@ class Kinetics_sparse(torch.utils.data.Dataset):
 
         logger.info("Constructing Kinetics {}...".format(mode))
         self._construct_loader()
+        # Spatial crops of the same temporal view share one decoded clip.
+        self._decode_cache = utils.DecodeCache(
+            cfg.DATA_LOADER.DECODE_CACHE_SIZE if self.mode in ["test"] else 0
+        )
         self.aug = False
         self.rand_erase = False
         self.use_temporal_gradient = False
@@ -102,26 +113,42 @@ class Kinetics_sparse(torch.utils.data.Dataset):
         self._labels = []
         self._spatial_temporal_idx = []
         with g_pathmgr.open(path_to_file, "r") as f:
-            for clip_idx, path_label in enumerate(f.read().splitlines()):
-                assert (
-                    len(path_label.split(self.cfg.DATA.PATH_LABEL_SEPARATOR))
-                    == 2
-                )
-                path, label = path_label.split(
-                    self.cfg.DATA.PATH_LABEL_SEPARATOR
+            try:
+                manifest = pd.read_csv(
+                    f,
+                    sep=self.cfg.DATA.PATH_LABEL_SEPARATOR,
+                    header=None,
+                    index_col=False,
+                    dtype={0: str, 1: int},
+                    quoting=csv.QUOTE_NONE,
+                    keep_default_na=False,
+                    engine="c",
                 )
-                for idx in range(self._num_clips):
-                    self._path_to_videos.append(
-                        os.path.join(self.cfg.DATA.PATH_PREFIX, path)
-                    )
-                    self._labels.append(int(label))
-                    self._spatial_temporal_idx.append(idx)
-                    self._video_meta[clip_idx * self._num_clips + idx] = {}
+            except pd.errors.EmptyDataError:
+                # Reported by the "Failed to load" assert below.
+                manifest = pd.DataFrame(columns=range(2))
+        assert (
+            manifest.shape[1] == 2
+        ), "Expected 2 fields per line in {}".format(path_to_file)
+        for path, label in zip(manifest[0].tolist(), manifest[1].tolist()):
+            # Join once per video, the clips of a video share the string.
+            path = os.path.join(self.cfg.DATA.PATH_PREFIX, path)
+            for idx in range(self._num_clips):
+                self._path_to_videos.append(path)
+                self._labels.append(label)
+                self._spatial_temporal_idx.append(idx)
         assert (
             len(self._path_to_videos) > 0
         ), "Failed to load Kinetics split {} from {}".format(
             self._split_idx, path_to_file
         )
+        # Pack the per-clip lists into flat arrays, forked data loader
+        # workers then share them instead of each copying the list objects.
+        self._path_to_videos = utils.StringArray(self._path_to_videos)
+        self._labels = np.asarray(self._labels, dtype=np.int64)
+        self._spatial_temporal_idx = np.asarray(
+            self._spatial_temporal_idx, dtype=np.int64
+        )
         logger.info(
             "Constructing kinetics dataloader (size: {}) from {}".format(
                 len(self._path_to_videos), path_to_file
@@ -210,66 +237,26 @@ class Kinetics_sparse(torch.utils.data.Dataset):
         # Try to decode and sample a clip from a video. If the video can not be
         # decoded, repeatly find a random video replacement that can be decoded.
         for i_try in range(self._num_retries):
-            video_container = None
-            try:
-                video_container = container.get_video_container(
-                    self._path_to_videos[index],
-                    self.cfg.DATA_LOADER.ENABLE_MULTI_THREAD_DECODE,
-                    self.cfg.DATA.DECODING_BACKEND,
-                )
-            except Exception as e:
-                logger.info(
-                    "Failed to load video from {} with error {}".format(
-                        self._path_to_videos[index], e
-                    )
-                )
-            # Select a random video if the current video was not able to access.
-            if video_container is None:
-                logger.warning(
-                    "Failed to load video idx {} from {}; trial {}".format(
-                        index, self._path_to_videos[index], i_try
-                    )
-                )
-                if self.mode not in ["test"] and i_try > self._num_retries // 2:
-                    # let's try another one
-                    index = random.randint(0, len(self._path_to_videos) - 1)
-                elif self.mode in ["test"] and i_try > self._num_retries // 2:
-                    # BUG: should not repeat video
-                    logger.info(
-                        "Failed to load video idx {} from {}; use idx {}".format(
-                            index, self._path_to_videos[index], index - 1
-                        )
-                    )
-                    index = index - 1
-                continue
-
-            # Decode video. Meta info is used to perform selective decoding.
-            frames = decoder.decode(
-                video_container,
-                sampling_rate,
-                self.cfg.DATA.NUM_FRAMES,
+            cache_key = (
+                index // self._num_clips,
                 temporal_sample_index,
-                self.cfg.TEST.NUM_ENSEMBLE_VIEWS,
-                video_meta=self._video_meta[index],
-                target_fps=self.cfg.DATA.TARGET_FPS,
-                backend=self.cfg.DATA.DECODING_BACKEND,
-                max_spatial_scale=min_scale,
-                use_offset=self.cfg.DATA.USE_OFFSET_SAMPLING,
-                sparse=True
+                sampling_rate,
             )
-
-            # If decoding failed (wrong format, video is too short, and etc),
-            # select another video.
+            frames = self._decode_cache.get(cache_key)
             if frames is None:
-                logger.warning(
-                    "Failed to decode video idx {} from {}; trial {}".format(
-                        index, self._path_to_videos[index], i_try
-                    )
+                frames, index = self._decode_clip(
+                    index,
+                    i_try,
+                    temporal_sample_index,
+                    sampling_rate,
+                    min_scale,
+                    max_scale,
                 )
-                if self.mode not in ["test"] and i_try > self._num_retries // 2:
-                    # let's try another one
-                    index = random.randint(0, len(self._path_to_videos) - 1)
-                continue
+                # The video could not be opened or decoded, try again with the
+                # (possibly replaced) index.
+                if frames is None:
+                    continue
+                self._decode_cache.put(cache_key, frames)
 
             if self.aug:
                 if self.cfg.AUG.NUM_SAMPLE > 1:
@@ -303,12 +290,20 @@ class Kinetics_sparse(torch.utils.data.Dataset):
                         crop_size,
                     )
 
+            elif self.mode in ["test"]:
+                # The testing is deterministic and no jitter should be
+                # performed. min_scale, max_scale, and crop_size are expect to
+                # be the same.
+                assert len({min_scale, max_scale, crop_size}) == 1
+                frames, _ = transform.uniform_crop(
+                    frames, crop_size, spatial_sample_index
+                )
+
             else:
-                frames = utils.tensor_normalize(
+                # T H W C -> C T H W.
+                frames = utils.tensor_normalize_permute(
                     frames, self.cfg.DATA.MEAN, self.cfg.DATA.STD
                 )
-                # T H W C -> C T H W.
-                frames = frames.permute(3, 0, 1, 2)
                 # Perform data augmentation.
                 frames = utils.spatial_sampling(
                     frames,
@@ -330,6 +325,105 @@ class Kinetics_sparse(torch.utils.data.Dataset):
                 )
             )
 
+    def _decode_clip(
+        self,
+        index,
+        i_try,
+        temporal_sample_index,
+        sampling_rate,
+        min_scale,
+        max_scale,
+    ):
+        """
+        Open the video and decode one clip from it. In test mode the clip is
+        also normalized and rescaled, as all its spatial crops share it.
+        Args:
+            index (int): the video index.
+            i_try (int): the current trial, failing videos are replaced by a
+                random one after half of the trials.
+            temporal_sample_index (int): the temporal view to decode, -1 for
+                random sampling.
+            sampling_rate (int): the frame sampling rate.
+            min_scale (int): the minimal short side scale.
+            max_scale (int): the maximal short side scale.
+        Returns:
+            frames (tensor or None): the decoded clip, None if the video could
+                not be opened or decoded.
+            index (int): the video index to use for the next trial.
+        """
+        video_container = None
+        try:
+            video_container = container.get_video_container(
+                self._path_to_videos[index],
+                self.cfg.DATA_LOADER.ENABLE_MULTI_THREAD_DECODE,
+                self.cfg.DATA.DECODING_BACKEND,
+                num_threads=self._decode_threads,
+            )
+        except Exception as e:
+            logger.info(
+                "Failed to load video from {} with error {}".format(
+                    self._path_to_videos[index], e
+                )
+            )
+        # Select a random video if the current video was not able to access.
+        if video_container is None:
+            logger.warning(
+                "Failed to load video idx {} from {}; trial {}".format(
+                    index, self._path_to_videos[index], i_try
+                )
+            )
+            if self.mode not in ["test"] and i_try > self._num_retries // 2:
+                # let's try another one
+                index = random.randint(0, len(self._path_to_videos) - 1)
+            elif self.mode in ["test"] and i_try > self._num_retries // 2:
+                # BUG: should not repeat video
+                logger.info(
+                    "Failed to load video idx {} from {}; use idx {}".format(
+                        index, self._path_to_videos[index], index - 1
+                    )
+                )
+                index = index - 1
+            return None, index
+
+        # Decode video. Meta info is used to perform selective decoding.
+        frames = decoder.decode(
+            video_container,
+            sampling_rate,
+            self.cfg.DATA.NUM_FRAMES,
+            temporal_sample_index,
+            self.cfg.TEST.NUM_ENSEMBLE_VIEWS,
+            video_meta=self._video_meta.setdefault(index, {}),
+            target_fps=self.cfg.DATA.TARGET_FPS,
+            backend=self.cfg.DATA.DECODING_BACKEND,
+            max_spatial_scale=min_scale,
+            use_offset=self.cfg.DATA.USE_OFFSET_SAMPLING,
+            sparse=True
+        )
+
+        # If decoding failed (wrong format, video is too short, and etc),
+        # select another video.
+        if frames is None:
+            logger.warning(
+                "Failed to decode video idx {} from {}; trial {}".format(
+                    index, self._path_to_videos[index], i_try
+                )
+            )
+            if self.mode not in ["test"] and i_try > self._num_retries // 2:
+                # let's try another one
+                index = random.randint(0, len(self._path_to_videos) - 1)
+            return None, index
+        if self.mode in ["test"]:
+            # The spatial views of a temporal view only differ in the crop,
+            # so normalize and rescale once before caching.
+            # T H W C -> C T H W.
+            frames = utils.tensor_normalize_permute(
+                frames, self.cfg.DATA.MEAN, self.cfg.DATA.STD
+            )
+            frames, _ = transform.random_short_side_scale_jitter(
+                frames, min_scale, max_scale
+            )
+        return frames, index
+
     def _aug_frame(
         self,
         frames,
@@ -343,18 +437,14 @@ class Kinetics_sparse(torch.utils.data.Dataset):
             auto_augment=self.cfg.AUG.AA_TYPE,
             interpolation=self.cfg.AUG.INTERPOLATION,
         )
-        # T H W C -> T C H W.
-        frames = frames.permute(0, 3, 1, 2)
         list_img = self._frame_to_list_img(frames)
         list_img = aug_transform(list_img)
         frames = self._list_img_to_frames(list_img)
-        frames = frames.permute(0, 2, 3, 1)
 
-        frames = utils.tensor_normalize(
+        # T H W C -> C T H W.
+        frames = utils.tensor_normalize_permute(
             frames, self.cfg.DATA.MEAN, self.cfg.DATA.STD
         )
-        # T H W C -> C T H W.
-        frames = frames.permute(3, 0, 1, 2)
         # Perform data augmentation.
         scl, asp = (
             self.cfg.DATA.TRAIN_JITTER_SCALES_RELATIVE,
@@ -396,14 +486,15 @@ class Kinetics_sparse(torch.utils.data.Dataset):
         return frames
 
     def _frame_to_list_img(self, frames):
-        img_list = [
-            transforms.ToPILImage()(frames[i]) for i in range(frames.size(0))
-        ]
+        # T H W C uint8 frames map onto PIL images without any conversion.
+        img_list = [Image.fromarray(frame) for frame in frames.numpy()]
         return img_list
 
     def _list_img_to_frames(self, img_list):
-        img_list = [transforms.ToTensor()(img) for img in img_list]
-        return torch.stack(img_list)
+        # Stay in uint8, tensor_normalize_permute expects 0-255 frames and
+        # folds the 1/255 scaling into the mean and std.
+        img_list = [np.asarray(img) for img in img_list]
+        return torch.from_numpy(np.stack(img_list))
 
     def __len__(self):
         """
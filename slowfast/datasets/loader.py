@@ -5,6 +5,8 @@
 
 import itertools
 import numpy as np
+import queue
+import threading
 from functools import partial
 import torch
 from torch.utils.data._utils.collate import default_collate
@@ -82,6 +84,109 @@ def detection_collate(batch):
     return inputs, labels, video_idx, collated_extra_data
 
 
+class BackgroundDataLoader(torch.utils.data.DataLoader):
+    """
+    DataLoader that pulls batches in a background thread and keeps up to
+    `max_prefetch` of them ready, so that a batch whose clips were slow to
+    decode is hidden behind the compute of the previous iterations instead of
+    stalling the training loop. `prefetch_factor` bounds the queues of the
+    workers, this bounds the queue of the main process.
+    """
+
+    def __init__(self, *args, max_prefetch=1, **kwargs):
+        self.max_prefetch = max_prefetch
+        super(BackgroundDataLoader, self).__init__(*args, **kwargs)
+
+    def __iter__(self):
+        return _BackgroundIterator(
+            super(BackgroundDataLoader, self).__iter__(), self.max_prefetch
+        )
+
+
+class _BackgroundIterator(object):
+    """
+    Consume an iterator in a daemon thread through a bounded queue. Exceptions
+    raised by the iterator are re-raised in the consuming thread. The thread
+    stops once the consumer closes or drops this iterator, e.g. when precise
+    BN only draws a few batches.
+    """
+
+    _END = object()
+
+    def __init__(self, iterator, max_prefetch):
+        self._queue = queue.Queue(max_prefetch)
+        self._stop = threading.Event()
+        # Set once the end or an error was dequeued, the thread has exited.
+        self._done = False
+        self._error = None
+        # The thread must not reference self, otherwise it would keep this
+        # iterator alive and __del__ would never stop it.
+        self._thread = threading.Thread(
+            target=_BackgroundIterator._run,
+            args=(iterator, self._queue, self._stop),
+            daemon=True,
+        )
+        self._thread.start()
+
+    @staticmethod
+    def _put(out_queue, stop, item):
+        """
+        Queue item, giving up once stop is set.
+        Returns:
+            (bool): True if the item was queued.
+        """
+        while not stop.is_set():
+            try:
+                out_queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    @staticmethod
+    def _run(iterator, out_queue, stop):
+        put = partial(_BackgroundIterator._put, out_queue, stop)
+        try:
+            for item in iterator:
+                if not put((item, None)):
+                    return
+        except Exception as e:
+            put((None, e))
+            return
+        put((_BackgroundIterator._END, None))
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._done:
+            if self._error is not None:
+                raise self._error
+            raise StopIteration
+        item, error = self._queue.get()
+        if error is not None:
+            self._done, self._error = True, error
+            raise error
+        if item is self._END:
+            self._done = True
+            raise StopIteration
+        return item
+
+    def close(self):
+        """
+        Stop the thread and drop the batches it has already queued.
+        """
+        self._stop.set()
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                break
+
+    def __del__(self):
+        self.close()
+
+
 def construct_loader(cfg, split, is_precise_bn=False):
     """
     Constructs the data loader for the given dataset.
@@ -111,8 +216,15 @@ def construct_loader(cfg, split, is_precise_bn=False):
     # Construct the dataset
     dataset = build_dataset(dataset_name, cfg, split)
 
+    if cfg.DATA_LOADER.MAX_PREFETCH > 0:
+        data_loader_cls = partial(
+            BackgroundDataLoader, max_prefetch=cfg.DATA_LOADER.MAX_PREFETCH
+        )
+    else:
+        data_loader_cls = torch.utils.data.DataLoader
+
     if isinstance(dataset, torch.utils.data.IterableDataset):
-        loader = torch.utils.data.DataLoader(
+        loader = data_loader_cls(
             dataset,
             batch_size=batch_size,
             num_workers=cfg.DATA_LOADER.NUM_WORKERS,
@@ -134,7 +246,7 @@ def construct_loader(cfg, split, is_precise_bn=False):
                 sampler, batch_size=batch_size, drop_last=drop_last, cfg=cfg
             )
             # Create a loader
-            loader = torch.utils.data.DataLoader(
+            loader = data_loader_cls(
                 dataset,
                 batch_sampler=batch_sampler,
                 num_workers=cfg.DATA_LOADER.NUM_WORKERS,
@@ -145,6 +257,18 @@ def construct_loader(cfg, split, is_precise_bn=False):
         else:
             # Create a sampler for multi-process training
             sampler = utils.create_sampler(dataset, shuffle, cfg)
+            if (
+                cfg.DATA_LOADER.BALANCE_DECODE_COST
+                and split in ["train"]
+                and hasattr(dataset, "_path_to_videos")
+                and isinstance(dataset._path_to_videos[0], str)
+            ):
+                sampler = utils.DecodeCostBalancedSampler(
+                    sampler,
+                    utils.get_video_file_sizes(dataset._path_to_videos),
+                    batch_size,
+                    max(1, cfg.DATA_LOADER.NUM_WORKERS),
+                )
             # Create a loader
             if cfg.DETECTION.ENABLE:
                 collate_func = detection_collate
@@ -155,7 +279,7 @@ def construct_loader(cfg, split, is_precise_bn=False):
             else:
                 collate_func = None
 
-            loader = torch.utils.data.DataLoader(
+            loader = data_loader_cls(
                 dataset,
                 batch_size=batch_size,
                 shuffle=(False if sampler else shuffle),
@@ -170,6 +294,68 @@ def construct_loader(cfg, split, is_precise_bn=False):
     return loader
 
 
+class DataPrefetcher(object):
+    """
+    Wrap a data loader and copy the next batch to the current GPU on a side
+    CUDA stream while the current batch is being processed, so that the host
+    to device copy overlaps with the forward and backward passes. The copy is
+    only asynchronous if the loader uses pinned memory.
+    """
+
+    def __init__(self, loader):
+        """
+        Args:
+            loader (loader): data loader yielding `inputs`, `labels`,
+                `video_idx` and `meta`.
+        """
+        self.loader = loader
+        self.stream = torch.cuda.Stream()
+
+    def __len__(self):
+        return len(self.loader)
+
+    def __iter__(self):
+        loader_iter = iter(self.loader)
+        batch = self._preload(loader_iter)
+        while batch is not None:
+            torch.cuda.current_stream().wait_stream(self.stream)
+            # The tensors were allocated on the side stream, mark them as used
+            # by the current stream before their memory can be reused.
+            # video_idx stays on the CPU and is left out.
+            inputs, labels, video_idx, meta = batch
+            _apply_to_tensors(
+                (inputs, labels, meta),
+                lambda t: t.record_stream(torch.cuda.current_stream()),
+            )
+            next_batch = self._preload(loader_iter)
+            yield batch
+            batch = next_batch
+
+    def _preload(self, loader_iter):
+        try:
+            inputs, labels, video_idx, meta = next(loader_iter)
+        except StopIteration:
+            return None
+        with torch.cuda.stream(self.stream):
+            inputs, labels, meta = _apply_to_tensors(
+                (inputs, labels, meta), lambda t: t.cuda(non_blocking=True)
+            )
+        return inputs, labels, video_idx, meta
+
+
+def _apply_to_tensors(data, func):
+    """
+    Apply func to every tensor in nested lists, tuples and dicts.
+    """
+    if isinstance(data, torch.Tensor):
+        return func(data)
+    elif isinstance(data, (list, tuple)):
+        return type(data)(_apply_to_tensors(d, func) for d in data)
+    elif isinstance(data, dict):
+        return {k: _apply_to_tensors(v, func) for k, v in data.items()}
+    return data
+
+
 def shuffle_dataset(loader, cur_epoch):
     """ "
     Shuffles the data.
@@ -193,6 +379,10 @@ def shuffle_dataset(loader, cur_epoch):
             if isinstance(loader.batch_sampler, ShortCycleBatchSampler)
             else loader.sampler
         )
+        while isinstance(
+            sampler, (utils.DecodeCostBalancedSampler, utils.ReadaheadSampler)
+        ):
+            sampler = sampler.sampler
     assert isinstance(
         sampler, (RandomSampler, DistributedSampler)
     ), "Sampler type '{}' not supported".format(type(sampler))
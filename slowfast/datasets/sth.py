@@ -7,8 +7,8 @@ import os
 import random
 from itertools import chain as chain
 import torch
-from torchvision import transforms
 import torch.utils.data
+from PIL import Image
 
 import slowfast.utils.logging as logging
 
@@ -270,11 +270,10 @@ class Sth(torch.utils.data.Dataset):
                 )
 
         else:
-            frames = utils.tensor_normalize(
+            # T H W C -> C T H W.
+            frames = utils.tensor_normalize_permute(
                 frames, self.cfg.DATA.MEAN, self.cfg.DATA.STD
             )
-            # T H W C -> C T H W.
-            frames = frames.permute(3, 0, 1, 2)
             # Perform data augmentation.
             frames = utils.spatial_sampling(
                 frames,
@@ -302,18 +301,14 @@ class Sth(torch.utils.data.Dataset):
             auto_augment=self.cfg.AUG.AA_TYPE,
             interpolation=self.cfg.AUG.INTERPOLATION,
         )
-        # T H W C -> T C H W.
-        frames = frames.permute(0, 3, 1, 2)
         list_img = self._frame_to_list_img(frames)
         list_img = aug_transform(list_img)
         frames = self._list_img_to_frames(list_img)
-        frames = frames.permute(0, 2, 3, 1)
 
-        frames = utils.tensor_normalize(
+        # T H W C -> C T H W.
+        frames = utils.tensor_normalize_permute(
             frames, self.cfg.DATA.MEAN, self.cfg.DATA.STD
         )
-        # T H W C -> C T H W.
-        frames = frames.permute(3, 0, 1, 2)
         # Perform data augmentation.
         scl, asp = (
             self.cfg.DATA.TRAIN_JITTER_SCALES_RELATIVE,
@@ -355,14 +350,15 @@ class Sth(torch.utils.data.Dataset):
         return frames
 
     def _frame_to_list_img(self, frames):
-        img_list = [
-            transforms.ToPILImage()(frames[i]) for i in range(frames.size(0))
-        ]
+        # T H W C uint8 frames map onto PIL images without any conversion.
+        img_list = [Image.fromarray(frame) for frame in frames.numpy()]
         return img_list
 
     def _list_img_to_frames(self, img_list):
-        img_list = [transforms.ToTensor()(img) for img in img_list]
-        return torch.stack(img_list)
+        # Stay in uint8, tensor_normalize_permute expects 0-255 frames and
+        # folds the 1/255 scaling into the mean and std.
+        img_list = [np.asarray(img) for img in img_list]
+        return torch.from_numpy(np.stack(img_list))
 
     def __len__(self):
         """
@@ -34,6 +34,8 @@ def _pil_interp(method):
         return Image.LANCZOS
     elif method == "hamming":
         return Image.HAMMING
+    elif method == "nearest":
+        return Image.NEAREST
     else:
         return Image.BILINEAR
 
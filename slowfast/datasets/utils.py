@@ -1,16 +1,18 @@
 #!/usr/bin/env python3
 
 import logging
+import math
 import numpy as np
 import os
 import random
 import time
-from collections import defaultdict
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
 import cv2
 import torch
 from iopath.common.file_io import g_pathmgr
 from torch.utils.data.distributed import DistributedSampler
-from torch.utils.data import RandomSampler
+from torch.utils.data import RandomSampler, Sampler, SequentialSampler
 
 from . import transform as transform
 
@@ -267,9 +269,7 @@ def as_binary_vector(labels, num_classes):
         labels (numpy array): the resulting binary vector.
     """
     label_arr = np.zeros((num_classes,))
-
-    for lbl in set(labels):
-        label_arr[lbl] = 1.0
+    label_arr[np.asarray(labels, dtype=np.int64)] = 1.0
     return label_arr
 
 
@@ -288,22 +288,6 @@ def aggregate_labels(label_list):
     return list(set(all_labels))
 
 
-def convert_to_video_level_labels(labels):
-    """
-    Aggregate annotations from all frames of a video to form video-level labels.
-    Args:
-        labels (list): The input label list.
-    Returns:
-        labels (list): Same as input, but with each label replaced by
-        a video-level one.
-    """
-    for video_id in range(len(labels)):
-        video_level_labels = aggregate_labels(labels[video_id])
-        for i in range(len(labels[video_id])):
-            labels[video_id][i] = video_level_labels
-    return labels
-
-
 def load_image_lists(frame_list_file, prefix="", return_list=False):
     """
     Load image paths and labels from a "frame list".
@@ -357,16 +341,44 @@ def tensor_normalize(tensor, mean, std):
         mean (tensor or list): mean value to subtract.
         std (tensor or list): std to divide.
     """
-    if tensor.dtype == torch.uint8:
-        tensor = tensor.float()
-        tensor = tensor / 255.0
     if type(mean) == list:
         mean = torch.tensor(mean)
     if type(std) == list:
         std = torch.tensor(std)
-    tensor = tensor - mean
-    tensor = tensor / std
-    return tensor
+    if tensor.dtype == torch.uint8:
+        # The conversion already copies, so the rest can be done in place.
+        tensor = tensor.float().div_(255.0).sub_(mean)
+    else:
+        tensor = tensor - mean
+    return tensor.div_(std)
+
+
+def tensor_normalize_permute(tensor, mean, std):
+    """
+    Normalize a `num frames` x `height` x `width` x `channel` tensor and return
+    it as a contiguous `channel` x `num frames` x `height` x `width` tensor.
+    The dtype conversion and the layout change are done in a single copy, and
+    the normalization is applied in place on the result, instead of
+    allocating a new tensor for every step.
+    Args:
+        tensor (tensor): tensor to normalize.
+        mean (tensor or list): mean value to subtract.
+        std (tensor or list): std to divide.
+    Returns:
+        out (tensor): the normalized tensor.
+    """
+    out = torch.empty(
+        (tensor.shape[3],) + tuple(tensor.shape[:3]),
+        dtype=torch.float32,
+        device=tensor.device,
+    )
+    out.permute(1, 2, 3, 0).copy_(tensor)
+    # Fold the uint8 rescaling into the mean and std.
+    scale = 255.0 if tensor.dtype == torch.uint8 else 1.0
+    mean = torch.as_tensor(mean, dtype=torch.float32).view(-1, 1, 1, 1)
+    std = torch.as_tensor(std, dtype=torch.float32).view(-1, 1, 1, 1)
+    out.sub_(mean * scale).div_(std * scale)
+    return out
 
 
 def get_random_sampling_rate(long_cycle_sampling_rate, sampling_rate):
@@ -398,6 +410,26 @@ def revert_tensor_normalize(tensor, mean, std):
     return tensor
 
 
+def get_num_decode_threads(cfg):
+    """
+    Split the CPUs available to this process among the data loader workers of
+    all the training processes of the node, so that each worker decodes with
+    several threads without oversubscribing the CPU.
+    Args:
+        cfg (CfgNode): configs. Details can be found in
+            slowfast/config/defaults.py
+    Returns:
+        (int): the number of decoding threads per data loader worker.
+    """
+    if hasattr(os, "sched_getaffinity"):
+        # Respects CPU affinity and cpusets, unlike os.cpu_count().
+        num_cpus = len(os.sched_getaffinity(0))
+    else:
+        num_cpus = os.cpu_count() or 1
+    num_workers = max(1, cfg.DATA_LOADER.NUM_WORKERS) * max(1, cfg.NUM_GPUS)
+    return max(1, num_cpus // num_workers)
+
+
 def create_sampler(dataset, shuffle, cfg):
     """
     Create sampler for the given dataset.
@@ -410,11 +442,168 @@ def create_sampler(dataset, shuffle, cfg):
     Returns:
         sampler (Sampler): the created sampler.
     """
-    sampler = DistributedSampler(dataset) if cfg.NUM_GPUS > 1 else RandomSampler(dataset) #None
+    if shuffle:
+        sampler = (
+            DistributedSampler(dataset)
+            if cfg.NUM_GPUS > 1
+            else RandomSampler(dataset)
+        )
+    else:
+        # Keep consecutive indices (e.g. the spatial crops of a test view)
+        # together, so that they are loaded by the same worker.
+        sampler = (
+            ContiguousDistributedSampler(dataset, shuffle=False)
+            if cfg.NUM_GPUS > 1
+            else SequentialSampler(dataset)
+        )
+    if (
+        cfg.DATA_LOADER.READAHEAD
+        and hasattr(os, "posix_fadvise")
+        and hasattr(dataset, "_path_to_videos")
+        and isinstance(dataset._path_to_videos[0], str)
+    ):
+        sampler = ReadaheadSampler(sampler, dataset._path_to_videos)
 
     return sampler
 
 
+class ContiguousDistributedSampler(DistributedSampler):
+    """
+    DistributedSampler that gives every replica a contiguous chunk of the
+    indices instead of every num_replicas-th index. Only for evaluation, the
+    indices are not shuffled.
+    """
+
+    def __iter__(self):
+        indices = list(range(len(self.dataset)))
+        if not self.drop_last:
+            # Pad to make the number of indices evenly divisible.
+            padding_size = self.total_size - len(indices)
+            indices += (indices * math.ceil(padding_size / len(indices)))[
+                :padding_size
+            ]
+        else:
+            indices = indices[: self.total_size]
+        start = self.rank * self.num_samples
+        return iter(indices[start : start + self.num_samples])
+
+
+class ReadaheadSampler(Sampler):
+    """
+    Wrap a sampler and ask the kernel to start reading the video file of every
+    sampled index in the background. The data loader draws indices
+    `prefetch_factor` batches per worker ahead of their use, so on a cold page
+    cache the files are being read while the workers decode earlier batches,
+    instead of each open blocking on storage.
+    """
+
+    def __init__(self, sampler, paths):
+        """
+        Args:
+            sampler (Sampler): the wrapped sampler.
+            paths (list): path to the video of every index.
+        """
+        self.sampler = sampler
+        self.paths = paths
+
+    def __iter__(self):
+        for idx in self.sampler:
+            _readahead(self.paths[idx])
+            yield idx
+
+    def __len__(self):
+        return len(self.sampler)
+
+
+class DecodeCostBalancedSampler(Sampler):
+    """
+    Wrap a sampler and, inside every window of `num_batches` consecutive
+    batches, deal the sampled indices to the batches in snake order of their
+    decoding cost. Every batch of the window then mixes expensive and cheap
+    videos, so one worker does not get stuck on a batch of long or high
+    resolution videos while the others idle. The window holds the same indices
+    as without balancing, so each sample is still drawn exactly once per epoch.
+    """
+
+    def __init__(self, sampler, costs, batch_size, num_batches):
+        """
+        Args:
+            sampler (Sampler): the wrapped sampler.
+            costs (list or ndarray): estimated decoding cost of every index.
+            batch_size (int): number of indices per batch.
+            num_batches (int): number of batches balanced together, usually
+                the number of data loader workers.
+        """
+        self.sampler = sampler
+        self.costs = costs
+        self.batch_size = batch_size
+        self.num_batches = num_batches
+
+    def __iter__(self):
+        window = []
+        for idx in self.sampler:
+            window.append(idx)
+            if len(window) == self.batch_size * self.num_batches:
+                for idx in self._balance(window):
+                    yield idx
+                window = []
+        for idx in window:
+            yield idx
+
+    def __len__(self):
+        return len(self.sampler)
+
+    def _balance(self, window):
+        batches = [[] for _ in range(self.num_batches)]
+        order = sorted(window, key=lambda idx: self.costs[idx], reverse=True)
+        for rank, idx in enumerate(order):
+            turn, pos = divmod(rank, self.num_batches)
+            if turn % 2 == 1:
+                pos = self.num_batches - 1 - pos
+            batches[pos].append(idx)
+        return [idx for batch in batches for idx in batch]
+
+
+def get_video_file_sizes(paths, num_threads=16):
+    """
+    Estimate the decoding cost of videos by their file size, which scales with
+    both duration and resolution and only needs a stat call, not a probe of
+    the container.
+    Args:
+        paths (list): paths to the videos.
+        num_threads (int): number of threads issuing the stat calls.
+    Returns:
+        sizes (ndarray): file size of every video, 0 if it can not be accessed.
+    """
+
+    def _size(path):
+        try:
+            return os.path.getsize(path)
+        except OSError:
+            return 0
+
+    with ThreadPoolExecutor(max_workers=num_threads) as executor:
+        return np.array(list(executor.map(_size, paths)), dtype=np.int64)
+
+
+def _readahead(path):
+    """
+    Hint the kernel that the whole file will be needed soon. The hint is
+    asynchronous and failures are ignored, the worker reports unreadable
+    videos when it opens them.
+    """
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
 def loader_worker_init_fn(dataset):
     """
     Create init function passed to pytorch data loader.
@@ -422,3 +611,115 @@ def loader_worker_init_fn(dataset):
         dataset (torch.utils.data.Dataset): the given dataset.
     """
     return None
+
+
+class DecodeCache(object):
+    """
+    Bounded LRU cache of decoded clips. During testing, every temporal view of
+    a video is cropped NUM_SPATIAL_CROPS times from the same decoded frames.
+    These crops have consecutive indices, which the non-shuffling samplers of
+    create_sampler keep in the same batch and thus the same data loader
+    worker, so keeping the last few clips avoids decoding the frames again.
+    """
+
+    def __init__(self, max_size, log_after=1000):
+        """
+        Args:
+            max_size (int): maximal number of cached clips. If 0, nothing is
+                cached.
+            log_after (int): log the hit rate once after this many lookups.
+        """
+        self._max_size = max_size
+        self._cache = OrderedDict()
+        self._log_after = log_after
+        self._lookups = 0
+        self._hits = 0
+
+    def get(self, key):
+        """
+        Args:
+            key (hashable): key of the clip.
+        Returns:
+            frames (tensor or None): the cached clip, None if not cached.
+        """
+        if self._max_size <= 0:
+            return None
+        self._lookups += 1
+        frames = self._cache.get(key)
+        if frames is not None:
+            self._hits += 1
+            self._cache.move_to_end(key)
+        if self._lookups == self._log_after:
+            logger.info(
+                "Decode cache hit rate: {:.2f} over {} lookups.".format(
+                    self._hits / self._lookups, self._lookups
+                )
+            )
+        return frames
+
+    def put(self, key, frames):
+        """
+        Cache a clip and evict the least recently used ones beyond max_size.
+        Args:
+            key (hashable): key of the clip.
+            frames (tensor): the clip to cache.
+        """
+        if self._max_size <= 0:
+            return
+        self._cache[key] = frames
+        self._cache.move_to_end(key)
+        while len(self._cache) > self._max_size:
+            self._cache.popitem(last=False)
+
+
+class StringArray(object):
+    """
+    Read-only list of strings packed into a single numpy byte buffer. A list
+    of Python strings is touched by reference counting on every access, which
+    makes each forked data loader worker copy the pages holding it; the two
+    numpy arrays here are only read, so the workers keep sharing them.
+    Consecutive equal strings (the clips of a video) are stored once.
+    """
+
+    def __init__(self, strings):
+        """
+        Args:
+            strings (iterable): the strings to store.
+        """
+        chunks, starts, ends = [], [], []
+        prev, start, size = None, 0, 0
+        for string in strings:
+            if string != prev:
+                data = string.encode("utf-8")
+                chunks.append(data)
+                start, size = size, size + len(data)
+                prev = string
+            starts.append(start)
+            ends.append(size)
+        self._buffer = np.frombuffer(b"".join(chunks), dtype=np.uint8)
+        self._starts = np.asarray(starts, dtype=np.int64)
+        self._ends = np.asarray(ends, dtype=np.int64)
+
+    def __len__(self):
+        return len(self._starts)
+
+    def __getitem__(self, index):
+        """
+        Args:
+            index (int): the index of the string, may be negative.
+        Returns:
+            string (str): the string at the given index.
+        """
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("StringArray index out of range")
+        return (
+            self._buffer[self._starts[index] : self._ends[index]]
+            .tobytes()
+            .decode("utf-8")
+        )
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
@@ -1,12 +1,10 @@
 #!/usr/bin/env python3
 # Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved.
 
-import av
-import decord
-from decord import VideoReader
-from decord import cpu
 
-def get_video_container(path_to_vid, multi_thread_decode=False, backend="pyav"):
+def get_video_container(
+    path_to_vid, multi_thread_decode=False, backend="pyav", num_threads=0
+):
     """
     Given the path to the video, return the pyav video container.
     Args:
@@ -14,6 +12,8 @@ def get_video_container(path_to_vid, multi_thread_decode=False, backend="pyav"):
         multi_thread_decode (bool): if True, perform multi-thread decoding.
         backend (str): decoder backend, options include `pyav` and
             `torchvision`, default is `pyav`.
+        num_threads (int): number of decoding threads for `pyav` (only with
+            multi_thread_decode) and `decord`. If 0, let ffmpeg decide.
     Returns:
         container (container): video container.
     """
@@ -22,13 +22,25 @@ def get_video_container(path_to_vid, multi_thread_decode=False, backend="pyav"):
             container = fp.read()
         return container
     elif backend == "pyav":
+        # Decoder libraries are imported on first use, so that only the
+        # backend in use is loaded by the main process and the workers.
+        import av
+
         container = av.open(path_to_vid)
         if multi_thread_decode:
             # Enable multiple threads for decoding.
             container.streams.video[0].thread_type = "AUTO"
+            if num_threads > 0:
+                container.streams.video[0].thread_count = num_threads
         return container
     elif backend == "decord":
-        container = VideoReader(path_to_vid, ctx=cpu(0))
+        import decord
+        from decord import VideoReader
+        from decord import cpu
+
+        container = VideoReader(
+            path_to_vid, ctx=cpu(0), num_threads=num_threads
+        )
         decord.bridge.set_bridge('torch')
         return container
     else:
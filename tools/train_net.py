@@ -48,6 +48,8 @@ def train_epoch(
     model.train()
     train_meter.iter_tic()
     data_size = len(train_loader)
+    if cfg.NUM_GPUS and cfg.DATA_LOADER.CUDA_PREFETCH:
+        train_loader = loader.DataPrefetcher(train_loader)
 
     if cfg.MIXUP.ENABLE:
         mixup_fn = MixUp(
@@ -205,6 +207,8 @@ def eval_epoch(val_loader, model, val_meter, loss_scaler, cur_epoch, cfg, writer
     # Evaluation mode enabled. The running stats would not be updated.
     model.eval()
     val_meter.iter_tic()
+    if cfg.NUM_GPUS and cfg.DATA_LOADER.CUDA_PREFETCH:
+        val_loader = loader.DataPrefetcher(val_loader)
 
     for cur_iter, (inputs, labels, _, meta) in enumerate(val_loader):
         if cfg.NUM_GPUS: